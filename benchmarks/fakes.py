@@ -0,0 +1,338 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 Mirantis Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local stand-ins for the Savanna, Glance and Nova services.
+
+FakeSavanna is a real HTTP server on localhost, so the benchmarks go
+through SavannaClient and its connection pool. It sends ETags, answers
+conditional GETs and compresses bodies like a caching-aware backend.
+FakeGlance and FakeNova replace the openstack_dashboard API helpers used
+by savanna.api.savanna.
+All of them sleep for a configurable latency per call and count calls.
+"""
+
+import collections
+import gzip
+import hashlib
+import io
+import json
+import re
+import socket
+import sys
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    import urlparse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib import parse as urlparse
+
+
+PROCESS_OPTIONS = {"JT": "job_tracker", "NN": "name_node",
+                   "TT": "task_tracker", "DN": "data_node"}
+
+
+class CallCounter(object):
+    """Thread-safe counter of outbound calls, by service and call name."""
+
+    def __init__(self):
+        self._counts = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def count(self, service, name):
+        with self._lock:
+            self._counts[(service, name)] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    def totals(self):
+        """Returns {service: calls}."""
+        totals = collections.defaultdict(int)
+        with self._lock:
+            for (service, name), calls in self._counts.items():
+                totals[service] += calls
+        return dict(totals)
+
+    def details(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+class Dataset(object):
+    """Generated tenant contents shared by all the fake services.
+
+    The first cluster is the "big" one, with big_cluster_nodes nodes;
+    every other cluster has nodes_per_cluster nodes.
+    """
+
+    def __init__(self, clusters=10, templates=10, nodes_per_cluster=3,
+                 big_cluster_nodes=10, images=20, flavors=10):
+        self.flavors = [Resource(id=str(i), name="m1.flavor%d" % i,
+                                 vcpus=i % 8 + 1, ram=512 * (i + 1),
+                                 disk=10 * (i + 1))
+                        for i in range(flavors)]
+        self.images = [Resource(id="image-%d" % i,
+                                name="hadoop-image-%d" % i,
+                                properties={})
+                       for i in range(images)]
+        self.templates = []
+        for i in range(templates):
+            node_type = ("JT+NN", "TT+DN")[i % 2]
+            template = {
+                "id": "template-%d" % i,
+                "name": "template-%d" % i,
+                "flavor_id": self.flavors[i % flavors].name,
+                "node_type": {"name": node_type,
+                              "processes": node_type.split("+")},
+            }
+            for process in node_type.split("+"):
+                template[PROCESS_OPTIONS[process]] = {"heap_size": 896}
+            self.templates.append(template)
+        self.clusters = []
+        self.servers = []
+        for i in range(clusters):
+            nodes_count = big_cluster_nodes if i == 0 else nodes_per_cluster
+            nodes = []
+            for j in range(nodes_count):
+                template = self.templates[j % len(self.templates)]
+                vm_id = "vm-%d-%d" % (i, j)
+                nodes.append({"vm_id": vm_id,
+                              "node_template": {"id": template["id"],
+                                                "name": template["name"]}})
+                self.servers.append(Resource(
+                    id=vm_id, name="cluster-%d-%03d" % (i, j),
+                    addresses={"private": [{"addr": "10.%d.%d.%d" % (
+                        i // 256 % 256, i % 256, j % 256)}]}))
+            self.clusters.append({
+                "id": "cluster-%d" % i,
+                "name": "cluster-%d" % i,
+                "base_image_id": self.images[i % images].id,
+                "status": ("Active", "Starting")[i % 10 == 9],
+                "node_templates": {self.templates[0]["name"]: 1,
+                                   self.templates[-1]["name"]:
+                                       max(nodes_count - 1, 0)},
+                "service_urls": {"jobtracker": "http://10.0.0.1:50030"},
+                "nodes": nodes,
+            })
+
+
+class Resource(object):
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class FakeSavanna(object):
+    """Savanna REST API served by a threaded HTTP server on localhost.
+
+    With paginate=True listings honour marker/limit as well as the name,
+    status and node_type filters.
+    """
+
+    def __init__(self, dataset, counter, latency=0.0, paginate=False):
+        self.dataset = dataset
+        self.counter = counter
+        self.latency = latency
+        self.paginate = paginate
+        self._server = None
+
+    @property
+    def url(self):
+        """Base URL, to be used as SAVANNA_ADDRESS."""
+        host, port = self._server.server_address[:2]
+        return "http://%s:%s/v0.2" % (host, port)
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(("127.0.0.1", 0),
+                                            _make_handler(self))
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, method, path, query):
+        """Returns (status, body) of the answer to a call."""
+        self.counter.count("savanna", "%s %s" % (
+            method, re.sub(r"/[^/]+$", "/<id>", path)
+            if path.count("/") > 1 else path))
+        time.sleep(self.latency)
+
+        for kind, key, items in (
+                ("clusters", "cluster", self.dataset.clusters),
+                ("node-templates", "node_template", self.dataset.templates)):
+            if path == "/" + kind:
+                if method == "POST":
+                    return 202, {}
+                return 200, {key + "s": self._page(items, query)}
+            if path.startswith("/%s/" % kind):
+                item_id = path.split("/")[2]
+                if method == "DELETE":
+                    return 204, None
+                for item in items:
+                    if item["id"] == item_id:
+                        return 200, {key: item}
+        return 404, {"error": "not found"}
+
+    def _page(self, items, query):
+        if not self.paginate:
+            return items
+        for field in ("name", "status", "node_type"):
+            if field in query:
+                value = query[field][0].lower()
+                items = [item for item in items
+                         if _matches(item, field, value)]
+        marker = query.get("marker", [None])[0]
+        limit = int(query.get("limit", [len(items)])[0])
+        start = 0
+        if marker is not None:
+            ids = [item["id"] for item in items]
+            start = ids.index(marker) + 1 if marker in ids else 0
+        return items[start:start + limit]
+
+
+def _matches(item, field, value):
+    if field == "name":
+        return value in item["name"].lower()
+    if field == "node_type":
+        return item["node_type"]["name"].lower() == value
+    return item[field].lower() == value
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients stop reading streamed listings early on purpose
+        if not issubclass(sys.exc_info()[0], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+
+def _make_handler(savanna):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _answer(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            parsed = urlparse.urlsplit(self.path)
+            # strip the /v0.2/<tenant_id> prefix
+            path = "/" + "/".join(parsed.path.split("/")[3:])
+            status, body = savanna.handle(self.command, path,
+                                          urlparse.parse_qs(parsed.query))
+            payload = b"" if body is None else json.dumps(body).encode()
+            headers = {"Content-Type": "application/json"}
+            if self.command == "GET" and status == 200:
+                etag = '"%s"' % hashlib.md5(payload).hexdigest()
+                headers["ETag"] = etag
+                if self.headers.get("If-None-Match") == etag:
+                    status, payload = 304, b""
+                elif "gzip" in self.headers.get("Accept-Encoding", ""):
+                    headers["Content-Encoding"] = "gzip"
+                    payload = _gzip(payload)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_DELETE = _answer
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _gzip(payload):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+        f.write(payload)
+    return buf.getvalue()
+
+
+class FakeGlance(object):
+    """Stand-in for openstack_dashboard.api.glance."""
+
+    def __init__(self, dataset, counter, latency=0.0, page_size=1000):
+        self.dataset = dataset
+        self.counter = counter
+        self.latency = latency
+        self.page_size = page_size
+
+    def image_list_detailed(self, request, marker=None, filters=None,
+                            paginate=False):
+        self.counter.count("glance", "image_list_detailed")
+        time.sleep(self.latency)
+        images = self.dataset.images
+        if marker is not None:
+            ids = [image.id for image in images]
+            images = images[ids.index(marker) + 1:]
+        page = images[:self.page_size]
+        return page, paginate and len(images) > self.page_size
+
+    def image_get(self, request, image_id):
+        self.counter.count("glance", "image_get")
+        time.sleep(self.latency)
+        for image in self.dataset.images:
+            if image.id == image_id:
+                return image
+        raise LookupError(image_id)
+
+
+class FakeNova(object):
+    """Stand-in for openstack_dashboard.api.nova."""
+
+    def __init__(self, dataset, counter, latency=0.0):
+        self.dataset = dataset
+        self.counter = counter
+        self.latency = latency
+
+    def server_list(self, request, search_opts=None, all_tenants=False):
+        self.counter.count("nova", "server_list")
+        time.sleep(self.latency)
+        search_opts = search_opts or {}
+        servers = self.dataset.servers
+        if search_opts.get("marker") is not None:
+            ids = [server.id for server in servers]
+            servers = servers[ids.index(search_opts["marker"]) + 1:]
+        # like Nova, which caps listings at osapi_max_limit
+        limit = min(search_opts.get("limit", 1000), 1000)
+        return list(servers[:limit])
+
+    def server_get(self, request, instance_id):
+        self.counter.count("nova", "server_get")
+        time.sleep(self.latency)
+        for server in self.dataset.servers:
+            if server.id == instance_id:
+                return server
+        raise LookupError(instance_id)
+
+    def flavor_list(self, request):
+        self.counter.count("nova", "flavor_list")
+        time.sleep(self.latency)
+        return list(self.dataset.flavors)
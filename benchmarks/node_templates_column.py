@@ -0,0 +1,102 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 Mirantis Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmark of the "Node Templates" column of ClustersTable.
+
+Compares the former per-row render_to_string of a template fragment with
+the direct HTML builder now used by render_templates:
+
+    python -m benchmarks.node_templates_column [ROWS ...]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from django.conf import settings
+
+
+OLD_FRAGMENT = """<ul>
+    {% for template in cluster.node_templates %}
+        <li>{{ template }}</li>
+    {% endfor %}
+</ul>"""
+OLD_TEMPLATE_NAME = "savanna/hadoop/_nodes_list.html"
+
+
+class FakeCluster(object):
+    def __init__(self, i):
+        self.node_templates = ["jt_nn.medium: 1",
+                               "tt_dn.large-%d: %d" % (i, i % 10 + 1)]
+
+
+def _configure(template_dir):
+    if not settings.configured:
+        settings.configure(
+            TEMPLATE_DIRS=[template_dir],
+            TEMPLATES=[{
+                "BACKEND": "django.template.backends.django.DjangoTemplates",
+                "DIRS": [template_dir]}],
+            INSTALLED_APPS=[])
+    import django
+    if hasattr(django, "setup"):
+        django.setup()
+
+
+def _render_old(cluster):
+    from django.template import loader
+    return loader.render_to_string(OLD_TEMPLATE_NAME, {"cluster": cluster})
+
+
+def run(row_counts, repeat=3):
+    template_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(template_dir, OLD_TEMPLATE_NAME)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(OLD_FRAGMENT)
+        _configure(template_dir)
+
+        from savanna.hadoop.tables import render_templates
+
+        results = []
+        for rows in row_counts:
+            clusters = [FakeCluster(i) for i in range(rows)]
+            old = min(timeit.repeat(
+                lambda: [_render_old(c) for c in clusters],
+                number=1, repeat=repeat))
+            new = min(timeit.repeat(
+                lambda: [render_templates(c) for c in clusters],
+                number=1, repeat=repeat))
+            results.append((rows, old, new))
+        return results
+    finally:
+        shutil.rmtree(template_dir)
+
+
+def main(argv):
+    row_counts = [int(arg) for arg in argv] or [1000, 10000]
+    print("%8s %14s %14s %9s" % ("rows", "template (s)", "builder (s)",
+                                 "speed-up"))
+    for rows, old, new in run(row_counts):
+        print("%8d %14.4f %14.4f %8.1fx" % (rows, old, new, old / new))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,261 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 Mirantis Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Offline performance benchmarks of the Hadoop panel.
+
+Runs the savanna.api.savanna functions and the IndexView,
+ClusterDetailView and CreateClusterView views against the local
+stand-in services of benchmarks.fakes, for a range of data sizes, and
+reports wall time, outbound calls per service and peak memory of each
+scenario. Caches are emptied before every measurement.
+
+Run it from an OpenStack Dashboard environment:
+
+    DJANGO_SETTINGS_MODULE=openstack_dashboard.settings \\
+        python -m benchmarks.suite --sizes 10,100,1000,10000 --latency 0.005
+"""
+
+import optparse
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+    import resource
+
+from benchmarks import fakes
+
+
+TENANT_ID = "benchmark-tenant"
+BIG_CLUSTER_ID = "cluster-0"
+
+
+class FakeUser(object):
+    id = "benchmark-user"
+    username = "benchmark"
+    tenant_id = TENANT_ID
+    tenant_name = "benchmark"
+    services_region = "RegionOne"
+    service_catalog = []
+    roles = []
+    is_superuser = False
+    token = fakes.Resource(id="benchmark-token")
+    authorized_tenants = [fakes.Resource(id=TENANT_ID, name="benchmark",
+                                         enabled=True)]
+
+    def is_authenticated(self):
+        return True
+
+    def has_perms(self, perms):
+        return True
+
+
+def make_request(path="/savanna/hadoop/"):
+    from django.contrib.messages.storage.cookie import CookieStorage
+    from django.test.client import RequestFactory
+
+    request = RequestFactory().get(path)
+    request.user = FakeUser()
+    request.session = {}
+    request.horizon = {"dashboard": None, "panel": None}
+    request._messages = CookieStorage(request)
+    return request
+
+
+class Environment(object):
+    """Points savanna.api.savanna at the stand-in services."""
+
+    def __init__(self, dataset, latency, paginate):
+        from savanna import instrumentation
+        from savanna.api import savanna as api
+
+        self.api = api
+        self.counter = fakes.CallCounter()
+        self.savanna = fakes.FakeSavanna(dataset, self.counter, latency,
+                                         paginate).start()
+        self._saved = (api.SAVANNA_ADDRESS, api.glance, api.nova)
+        api.SAVANNA_ADDRESS = self.savanna.url
+        api.glance = instrumentation.InstrumentedModule(
+            fakes.FakeGlance(dataset, self.counter, latency), "glance")
+        api.nova = instrumentation.InstrumentedModule(
+            fakes.FakeNova(dataset, self.counter, latency), "nova")
+
+    def reset(self):
+        for worker_cache in (self.api._listings, self.api._image_names,
+                             self.api._flavor_indexes,
+                             self.api._hadoop_images, self.api._addresses,
+                             self.api._revalidated):
+            worker_cache.clear()
+        self.counter.reset()
+
+    def close(self):
+        self.savanna.stop()
+        (self.api.SAVANNA_ADDRESS, self.api.glance,
+         self.api.nova) = self._saved
+
+
+def api_list_clusters(api, request):
+    _render_clusters(api, request, api.list_clusters(request))
+
+
+def api_list_clusters_page(api, request):
+    clusters, _more = api.list_clusters(request, paginate=True)
+    _render_clusters(api, request, clusters)
+
+
+def _render_clusters(api, request, clusters):
+    api.get_image_names(request, [cluster.base_image_id
+                                  for cluster in clusters])
+    for cluster in clusters:
+        cluster.node_templates
+
+
+def api_list_templates(api, request):
+    api.list_templates(request)
+
+
+def api_get_cluster_nodes(api, request):
+    for node in api.get_cluster_nodes(request, BIG_CLUSTER_ID):
+        node.vm
+
+
+def api_get_cluster_nodes_page(api, request):
+    nodes, _more = api.get_cluster_nodes(request, BIG_CLUSTER_ID,
+                                         paginate=True)
+    for node in nodes:
+        node.vm
+
+
+def api_get_cluster_node_groups(api, request):
+    api.get_cluster_node_groups(request, BIG_CLUSTER_ID)
+
+
+def index_view(api, request):
+    from savanna.hadoop.views import IndexView
+
+    view = IndexView()
+    view.request, view.args, view.kwargs = request, (), {}
+    view.construct_tables()
+    for table in view.get_tables().values():
+        table.render()
+
+
+def cluster_detail_view(api, request):
+    from savanna.hadoop.views import ClusterDetailView
+
+    view = ClusterDetailView()
+    view.request, view.args = request, ()
+    view.kwargs = {"cluster_id": BIG_CLUSTER_ID}
+    tab_group = view.get_tabs(request, **view.kwargs)
+    tab_group.load_tab_data()
+    tab_group.render()
+
+
+def create_cluster_view(api, request):
+    from savanna.hadoop.views import CreateClusterView
+
+    view = CreateClusterView()
+    view.request, view.args, view.kwargs = request, (), {}
+    view.get_workflow().render()
+
+
+SCENARIOS = (
+    ("api.list_clusters", api_list_clusters),
+    ("api.list_clusters(page)", api_list_clusters_page),
+    ("api.list_templates", api_list_templates),
+    ("api.get_cluster_nodes", api_get_cluster_nodes),
+    ("api.get_cluster_nodes(page)", api_get_cluster_nodes_page),
+    ("api.get_cluster_node_groups", api_get_cluster_node_groups),
+    ("IndexView", index_view),
+    ("ClusterDetailView", cluster_detail_view),
+    ("CreateClusterView", create_cluster_view),
+)
+
+
+def measure(env, scenario):
+    """Returns (wall seconds, {service: calls}, peak bytes) of a run."""
+    env.reset()
+    request = make_request()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    start = time.time()
+    scenario(env.api, request)
+    wall = time.time() - start
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        # without tracemalloc only the peak of the whole process is known
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return wall, env.counter.totals(), peak
+
+
+def run(sizes, latency=0.0, paginate=False, nodes_per_cluster=3,
+        scenarios=SCENARIOS):
+    """Yields (size, scenario name, wall, calls, peak) measurements."""
+    for size in sizes:
+        dataset = fakes.Dataset(clusters=size, templates=size,
+                                nodes_per_cluster=nodes_per_cluster,
+                                big_cluster_nodes=size)
+        env = Environment(dataset, latency, paginate)
+        try:
+            for name, scenario in scenarios:
+                wall, calls, peak = measure(env, scenario)
+                yield size, name, wall, calls, peak
+        finally:
+            env.close()
+
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--sizes", default="10,100,1000,10000",
+                      help="comma separated numbers of clusters, nodes "
+                           "and templates [%default]")
+    parser.add_option("--latency", type="float", default=0.0,
+                      help="seconds added to every outbound call "
+                           "[%default]")
+    parser.add_option("--nodes-per-cluster", type="int", default=3,
+                      help="nodes of every cluster but the big one "
+                           "[%default]")
+    parser.add_option("--server-pagination", action="store_true",
+                      default=False,
+                      help="make the fake Savanna honour marker/limit")
+    parser.add_option("--scenario", action="append", dest="scenarios",
+                      help="run only the named scenario (repeatable)")
+    options, _args = parser.parse_args(argv)
+
+    scenarios = [(name, func) for name, func in SCENARIOS
+                 if not options.scenarios or name in options.scenarios]
+    sizes = [int(size) for size in options.sizes.split(",")]
+
+    print("%-26s %7s %10s %8s %7s %6s %10s" % (
+        "scenario", "size", "wall (ms)", "savanna", "glance", "nova",
+        "peak (KiB)"))
+    for size, name, wall, calls, peak in run(sizes, options.latency,
+                                             options.server_pagination,
+                                             options.nodes_per_cluster,
+                                             scenarios):
+        print("%-26s %7d %10.1f %8d %7d %6d %10d" % (
+            name, size, wall * 1000, calls.get("savanna", 0),
+            calls.get("glance", 0), calls.get("nova", 0), peak // 1024))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -15,33 +15,315 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import json
 import logging
+import os
+import random
+import threading
+import time
+
 import requests
-from openstack_dashboard.api import glance, nova
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.utils.http import urlencode
+from django.utils.translation import ugettext as _
+from horizon import exceptions
+from openstack_dashboard.api import glance as glance_api
+from openstack_dashboard.api import nova as nova_api
 from openstack_dashboard.api.base import url_for
 
+from savanna import cache
+from savanna import concurrency
+from savanna import instrumentation
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 try:
     from local.local_settings import SAVANNA_ADDRESS
 except ImportError:
     logging.warning("No local_settings file found.")
+    SAVANNA_ADDRESS = 'endpoints'
+
+LOG = logging.getLogger(__name__)
+
+# every Glance and Nova call made from here is timed and counted
+glance = instrumentation.InstrumentedModule(glance_api, "glance")
+nova = instrumentation.InstrumentedModule(nova_api, "nova")
+
+
+class SavannaException(exceptions.HorizonException):
+    """Raised when Savanna fails to carry out a call."""
+    pass
+
+
+class SavannaUnavailable(SavannaException):
+    """Raised when Savanna can't be reached or is known to be down."""
+    pass
+
+
+# let exceptions.handle() report Savanna failures to the user like the
+# other OpenStack client errors instead of re-raising them
+exceptions.RECOVERABLE += (SavannaException,)
+
+
+# endpoints resolved from service catalogs, keyed by (token, tenant, region)
+_addresses = cache.TTLCache(1024, 3600)
 
 
 def get_savanna_address(request):
-    savanna_address = 'endpoints'
+    if SAVANNA_ADDRESS != 'endpoints':
+        return SAVANNA_ADDRESS + "/" + request.user.tenant_id
+
+    # a token is scoped to one tenant and has a fixed catalog, so the
+    # endpoint is only looked up again once the token changes
+    key = (request.user.token.id, request.user.tenant_id,
+           getattr(request.user, "services_region", None))
+    address = _addresses.get(key)
+    if address is None:
+        address = url_for(request, 'mapreduce')
+        _addresses.set(key, address)
+    return address
+
+
+POOL_SIZE = getattr(settings, 'SAVANNA_POOL_SIZE', 10)
+CONNECT_TIMEOUT = getattr(settings, 'SAVANNA_CONNECT_TIMEOUT', 5)
+READ_TIMEOUT = getattr(settings, 'SAVANNA_READ_TIMEOUT', 30)
+# GETs are retried this many times, waiting a random delay of up to
+# RETRY_BACKOFF * 2 ** retry seconds before each retry
+RETRIES = getattr(settings, 'SAVANNA_RETRIES', 2)
+RETRY_BACKOFF = getattr(settings, 'SAVANNA_RETRY_BACKOFF', 0.5)
+BREAKER_THRESHOLD = getattr(settings, 'SAVANNA_BREAKER_THRESHOLD', 5)
+BREAKER_RESET_TIMEOUT = getattr(settings, 'SAVANNA_BREAKER_RESET_TIMEOUT', 30)
+# parsed GET results kept along with their ETag/Last-Modified validators
+REVALIDATION_CACHE_SIZE = getattr(settings,
+                                  'SAVANNA_REVALIDATION_CACHE_SIZE', 1024)
+REVALIDATION_CACHE_TTL = getattr(settings,
+                                 'SAVANNA_REVALIDATION_CACHE_TTL', 3600)
+
+# answers telling that the endpoint itself is unhealthy
+UNAVAILABLE_STATUSES = (502, 503, 504)
+
+
+class CircuitBreaker(object):
+    """Tracks the health of one endpoint.
+
+    After threshold consecutive failed calls the breaker opens, and calls
+    are refused for reset_timeout seconds. Then a single trial call is let
+    through, whose outcome closes the breaker or keeps it open.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # restart the timeout, so that only one trial call goes
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def succeeded(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.time()
 
-    try:
-        savanna_address = SAVANNA_ADDRESS
-    except NameError:
-        pass
 
-    if savanna_address == 'endpoints':
-        return url_for(request, 'mapreduce')
+class SavannaClient(object):
+    """Savanna REST API client.
 
-    return savanna_address + "/" + request.user.tenant_id
+    Requests go through one pooled keep-alive session, so consecutive
+    calls of a dashboard worker reuse already established connections
+    instead of doing a TCP/TLS handshake per call.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, retries=RETRIES,
+                 retry_backoff=RETRY_BACKOFF):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.session = requests.Session()
+        # compressed bodies are decoded transparently, also when streamed
+        self.session.headers.update({"Connection": "keep-alive",
+                                     "Accept-Encoding": "gzip, deflate"})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, request, method, path, data=None, stream=False,
+                headers=None):
+        if method != "GET":
+            # whatever was read during this request may be stale now
+            _request_memo(request).clear()
+        address = get_savanna_address(request)
+        # the address is tenant specific, the endpoint is scheme://host
+        breaker = self._breaker("/".join(address.split("/")[:3]))
+        if not breaker.allow():
+            raise SavannaUnavailable(
+                _("Savanna is unavailable, please try again later."))
+
+        headers = dict(headers or {},
+                       **{"x-auth-token": request.user.token.id,
+                          "Content-Type": "application/json"})
+        if data is not None:
+            data = json.dumps(data)
+        # only GETs are known to be safe to repeat
+        attempts = 1 + (self.retries if method == "GET" else 0)
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(random.uniform(
+                    0, self.retry_backoff * 2 ** (attempt - 1)))
+            error = None
+            try:
+                with instrumentation.timed(
+                        request, "savanna",
+                        instrumentation.endpoint_name(method, path)):
+                    resp = self.session.request(method, address + path,
+                                                data=data,
+                                                headers=headers,
+                                                timeout=self.timeout,
+                                                stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                continue
+            if resp.status_code not in UNAVAILABLE_STATUSES:
+                breaker.succeeded()
+                return resp
+            # gives the pooled connection back, a streamed body holds it
+            resp.close()
+
+        breaker.failed()
+        if error is not None:
+            LOG.warning("%s %s failed: %s" % (method, address + path, error))
+            raise SavannaUnavailable(
+                _("Unable to reach Savanna, please try again later."))
+        LOG.warning("%s %s answered %d" % (method, address + path,
+                                           resp.status_code))
+        raise SavannaUnavailable(
+            _("Savanna is unavailable, please try again later."))
+
+    def _breaker(self, endpoint):
+        with self._breakers_lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(
+                    BREAKER_THRESHOLD, BREAKER_RESET_TIMEOUT)
+            return self._breakers[endpoint]
+
+    def get(self, request, path, stream=False):
+        if stream:
+            # a streamed body can only be read once, so it isn't memoized
+            return self.request(request, "GET", path, stream=True)
+        return _memoized(request, ("GET", path),
+                         self.request, request, "GET", path)
+
+    def post(self, request, path, data):
+        return self.request(request, "POST", path, data)
+
+    def delete(self, request, path):
+        return self.request(request, "DELETE", path)
+
+
+def _request_memo(request):
+    memo = getattr(request, "_savanna_memo", None)
+    if memo is None:
+        memo = request._savanna_memo = {}
+    return memo
+
+
+def _memoized(request, key, func, *args):
+    """Returns func(*args), computed at most once per Django request.
+
+    Results live on the request object, so all the tabs, tables and views
+    taking part in rendering one page share them.
+    """
+    memo = _request_memo(request)
+    if key not in memo:
+        memo[key] = func(*args)
+    return memo[key]
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def client():
+    """Returns the SavannaClient shared by all threads of this worker."""
+    global _client, _client_pid
+    # pooled sockets must not be shared with forked worker processes
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = SavannaClient()
+                _client_pid = os.getpid()
+    return _client
+
+
+# parsed GET results of this worker, keyed by (tenant_id, path)
+_revalidated = cache.TTLCache(REVALIDATION_CACHE_SIZE, REVALIDATION_CACHE_TTL)
+
+
+def _get_parsed(request, path, parse, stream=False, variant=None):
+    """Returns parse(resp) of a GET of path, computed once per request.
+
+    The result is kept with the ETag and Last-Modified of its response,
+    and later GETs of the same path are made conditional. When Savanna
+    answers 304 Not Modified the kept result is returned as is, without
+    downloading or parsing the body again. Results of different parse
+    functions for the same path must be told apart by variant.
+    """
+    return _memoized(request, ("parsed", path, variant),
+                     _revalidate, request, path, parse, stream, variant)
+
+
+def _revalidate(request, path, parse, stream, variant):
+    key = (request.user.tenant_id, path, variant)
+    cached = _revalidated.get(key)
+    headers = {}
+    if cached is not None:
+        etag, last_modified, value = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    resp = client().request(request, "GET", path, stream=stream,
+                            headers=headers)
+    if resp.status_code == 304 and cached is not None:
+        resp.close()
+        return cached[2]
+
+    value = parse(resp)
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    if resp.status_code == 200 and value is not None and \
+            (etag or last_modified):
+        _revalidated.set(key, (etag, last_modified, value))
+    return value
 
 
 class NodeTemplate(object):
+    __slots__ = ("id", "name", "node_type", "flavor_name")
+
     def __init__(self, _id, node_template_name, node_type, flavor_name):
         self.id = _id
         self.name = node_template_name
@@ -50,46 +332,492 @@ class NodeTemplate(object):
 
 
 class Cluster(object):
-    def __init__(self, _id, name, node_templates, base_image, status,
+    """A row of the clusters listing.
+
+    The formatted node templates are only worked out when first accessed.
+    Rows are cached and shared by all the requests of a tenant, so they
+    hold nothing bound to a request; base image names are resolved with
+    get_image_names by whoever renders the rows.
+    """
+    __slots__ = ("id", "name", "status", "nodes_count", "base_image_id",
+                 "_templates", "_node_templates")
+
+    def __init__(self, _id, name, templates, base_image_id, status,
                  nodes_count):
         self.id = _id
         self.name = name
-        self.node_templates = node_templates
-        self.base_image = base_image
-        self.nodes_count = nodes_count
         self.status = status
+        self.nodes_count = nodes_count
+        self.base_image_id = base_image_id
+        self._templates = templates
+        self._node_templates = None
+
+    @property
+    def node_templates(self):
+        if self._node_templates is None:
+            self._node_templates = _format_templates(self._templates)
+        return self._node_templates
 
 
 class ClusterNode(object):
-    def __init__(self, _id, vm, template_name, template_id):
+    """A row of the cluster nodes table.
+
+    servers maps VM ids to Nova servers, and vm is only formatted from
+    it when first accessed.
+    """
+    __slots__ = ("id", "template_name", "template_id", "_servers", "_vm")
+
+    def __init__(self, _id, servers, template_name, template_id):
         self.id = _id
-        self.vm = vm
         self.template_name = template_name
         self.template_id = template_id
+        self._servers = servers
+        self._vm = None
 
+    @property
+    def vm(self):
+        if self._vm is None:
+            self._vm = _format_vm(self.id, self._servers.get(self.id))
+            self._servers = None
+        return self._vm
 
-def list_clusters(request):
-    token = request.user.token.id
-    resp = requests.get(
-        get_savanna_address(request) + "/clusters",
-        headers={"x-auth-token": token})
-    if resp.status_code == 200:
-        clusters_arr = resp.json()["clusters"]
-        clusters = []
-        for cl in clusters_arr:
-            id = cl["id"]
-            name = cl["name"]
-            base_image_id = cl["base_image_id"]
-            base_image_name = glance.image_get(request, base_image_id).name
-            node_templates = cl["node_templates"]
-            status = cl["status"]
-            nodes = cl["nodes"]
-            cluster = Cluster(id, name, _format_templates(node_templates),
-                base_image_name, status, len(nodes))
-            clusters.append(cluster)
-        return clusters
+
+# the nodes of a cluster made from one node template
+NodeGroup = collections.namedtuple("NodeGroup",
+                                   ["template_id", "template_name", "count"])
+
+
+LISTINGS_CACHE_SIZE = getattr(settings, 'SAVANNA_LISTINGS_CACHE_SIZE', 256)
+LISTINGS_CACHE_TTL = getattr(settings, 'SAVANNA_LISTINGS_CACHE_TTL', 15)
+
+# cluster and node template listings of this worker, keyed by
+# (tenant_id, kind, version); writes made through this module invalidate
+# them
+_listings = cache.TTLCache(LISTINGS_CACHE_SIZE, LISTINGS_CACHE_TTL)
+
+
+def _listing_version_key(request, kind):
+    return "savanna-listing-%s-%s" % (request.user.tenant_id, kind)
+
+
+def _listing_version(request, kind):
+    """Returns the current version of a tenant's listing.
+
+    Versions live in Django's cache, which a multi-process deployment
+    shares between its workers (e.g. memcached), so a write handled by
+    one worker makes all the others miss their cached listing too.
+    """
+    key = _listing_version_key(request, kind)
+    version = shared_cache.get(key)
+    if version is None:
+        # a lost version only makes the workers fetch the listing again
+        shared_cache.add(key, "%x" % random.getrandbits(64))
+        version = shared_cache.get(key)
+    return version
+
+
+def _cached_listing(request, kind, fetch, marker, limit, filters=None):
+    # fetch returns None if the listing couldn't be retrieved, and such
+    # a result is not cached
+    key = (request.user.tenant_id, kind, _listing_version(request, kind),
+           marker, limit, tuple(sorted((filters or {}).items())))
+    listing = _listings.get(key)
+    if listing is None:
+        listing = fetch(request, marker, limit, filters)
+        if listing is None:
+            return [], False
+        _listings.set(key, listing)
+    return listing
+
+
+# Savanna supports name/status/node_type query parameters on listings
+SERVER_FILTERS = getattr(settings, 'SAVANNA_SERVER_FILTERS', False)
+
+
+class ListingIndex(object):
+    """Items of a listing, looked up by a few of their attributes.
+
+    name matches case-insensitive substrings of the item names, the
+    other fields match whole values regardless of case.
+    """
+
+    def __init__(self, items, fields):
+        self.items = items
+        self._names = [(item.name or "").lower() for item in items]
+        self._by_field = {}
+        for field in fields:
+            positions = self._by_field[field] = {}
+            for pos, item in enumerate(items):
+                value = str(getattr(item, field)).lower()
+                positions.setdefault(value, set()).add(pos)
+
+    def search(self, filters):
+        """Returns the items matching all the filters, in listing order."""
+        matches = None
+        for field, value in filters.items():
+            if field == "name":
+                continue
+            if field not in self._by_field:
+                return []
+            found = self._by_field[field].get(value.lower(), set())
+            matches = found if matches is None else matches & found
+        if matches is None:
+            matches = range(len(self.items))
+        name = filters.get("name", "").lower()
+        return [self.items[pos] for pos in sorted(matches)
+                if name in self._names[pos]]
+
+    def page(self, filters, marker, limit):
+        """Returns the (page, has_more) of matches following marker."""
+        matches = self.search(filters)
+        ids = [item.id for item in matches]
+        start = ids.index(marker) + 1 if marker in ids else 0
+        if limit is None:
+            return matches[start:], False
+        return (matches[start:start + limit],
+                len(matches) > start + limit)
+
+
+def _filtered_listing(request, kind, fetch, fields, filters, marker,
+                      limit):
+    """Returns the (page, has_more) of kind's items matching filters.
+
+    With SAVANNA_SERVER_FILTERS the filters are part of the listing
+    query, so only matching items are fetched. Otherwise the whole
+    listing is fetched once and searched through its ListingIndex,
+    both being cached like the listing pages.
+    """
+    if SERVER_FILTERS:
+        return _cached_listing(request, kind, fetch, marker, limit, filters)
+
+    key = (request.user.tenant_id, kind, _listing_version(request, kind),
+           "index")
+    index = _listings.get(key)
+    if index is None:
+        items, _more = _cached_listing(request, kind, fetch, None, None)
+        index = ListingIndex(items, fields)
+        _listings.set(key, index)
+    return index.page(filters, marker, limit)
+
+
+def _invalidate_listing(request, kind):
+    _listings.invalidate(request.user.tenant_id, kind)
+    shared_cache.set(_listing_version_key(request, kind),
+                     "%x" % random.getrandbits(64))
+
+
+def listings_cache_stats():
+    """Returns hit/miss counters and size of the listings cache."""
+    return _listings.stats()
+
+
+PAGE_SIZE = getattr(settings, 'API_RESULT_PAGE_SIZE', 20)
+
+
+def _page_path(path, marker, limit, filters=None):
+    params = dict(filters or {})
+    if marker is not None:
+        params["marker"] = marker
+    if limit is not None:
+        # one extra item tells whether there is a next page
+        params["limit"] = limit + 1
+    if params:
+        path += "?" + urlencode(params)
+    return path
+
+
+def _page(items, marker, limit, key="id"):
+    """Cuts the page following marker out of a listing.
+
+    Returns a (page, has_more) tuple. Backends without marker/limit
+    support return the whole listing, which is then paginated here.
+    items may be an iterator, of which at most limit + 1 items are kept.
+    """
+    page = []
+    found = marker is None
+    for item in items:
+        if not found and item[key] == marker:
+            # the backend ignored the marker, the page starts after it
+            found = True
+            page = []
+        elif limit is None or len(page) <= limit:
+            page.append(item)
+        elif found:
+            break
+    if limit is None:
+        return page, False
+    return page[:limit], len(page) > limit
+
+
+CLUSTER_FILTERS = ("name", "status")
+
+
+def list_clusters(request, marker=None, paginate=False, filters=None):
+    """Returns the clusters of the request's tenant.
+
+    With paginate=True only the API_RESULT_PAGE_SIZE clusters following
+    marker are fetched, and a (clusters, has_more) tuple is returned.
+    filters is a dict of CLUSTER_FILTERS fields to match.
+    """
+    limit = PAGE_SIZE if paginate else None
+    if filters:
+        clusters, has_more = _filtered_listing(
+            request, "clusters", _fetch_clusters, ("status",),
+            filters, marker, limit)
+    else:
+        clusters, has_more = _cached_listing(request, "clusters",
+                                             _fetch_clusters, marker, limit)
+    if paginate:
+        return clusters, has_more
+    return clusters
+
+
+def _fetch_clusters(request, marker, limit, filters=None):
+    return _get_parsed(request,
+                       _page_path("/clusters", marker, limit, filters),
+                       lambda resp: _parse_clusters(resp, marker, limit),
+                       stream=ijson is not None)
+
+
+def _parse_clusters(resp, marker, limit):
+    try:
+        if resp.status_code != 200:
+            return None
+        clusters_arr, has_more = _page(_iter_clusters(resp), marker, limit)
+    finally:
+        resp.close()
+    clusters = []
+    for cl in clusters_arr:
+        clusters.append(_make_cluster(cl))
+    return clusters, has_more
+
+
+# ijson events starting a value
+_VALUE_EVENTS = ("start_map", "start_array", "string", "number", "boolean",
+                 "null")
+
+
+def _iter_clusters(resp):
+    """Yields the clusters of a listing, with "nodes" replaced by a count.
+
+    With ijson available the body is parsed as it is read, so the node
+    lists are only counted and never built.
+    """
+    if ijson is None:
+        for cl in resp.json()["clusters"]:
+            cl["nodes_count"] = len(cl.pop("nodes"))
+            yield cl
+        return
+
+    resp.raw.decode_content = True
+    builder = None
+    nodes_count = 0
+    for prefix, event, value in ijson.parse(resp.raw):
+        if prefix == "clusters.item" and event == "start_map":
+            builder = ijson.common.ObjectBuilder()
+            nodes_count = 0
+        elif builder is None:
+            continue
+        elif prefix == "clusters.item" and event == "end_map":
+            builder.event(event, value)
+            cl = builder.value
+            cl["nodes_count"] = nodes_count
+            builder = None
+            yield cl
+            continue
+        elif prefix == "clusters.item.nodes.item":
+            if event in _VALUE_EVENTS:
+                nodes_count += 1
+            continue
+        elif (prefix == "clusters.item.nodes"
+              or prefix.startswith("clusters.item.nodes.")):
+            continue
+        elif (prefix == "clusters.item" and event == "map_key"
+              and value == "nodes"):
+            continue
+        builder.event(event, value)
+
+
+def _make_cluster(cl):
+    if "nodes_count" in cl:
+        nodes_count = cl["nodes_count"]
     else:
-        return []
+        nodes_count = len(cl["nodes"])
+    return Cluster(cl["id"], cl["name"], cl["node_templates"],
+                   cl["base_image_id"], cl["status"], nodes_count)
+
+
+def get_image_names(request, image_ids):
+    """Resolves image ids to names with as few Glance calls as possible.
+
+    Names cached by this worker are used as is. If more than one image is
+    left, the visible images are listed once and joined by id; only ids
+    missing from the listing are fetched one by one. Unresolvable ids map
+    to themselves, and so do all the missing ones if Glance can't list
+    images.
+    """
+    names = {}
+    for image_id in set(image_ids):
+        names[image_id] = _image_names.get(image_id)
+    missing = set(image_id for image_id, name in names.items()
+                  if name is None)
+
+    if len(missing) > 1:
+        try:
+            for image in _iter_images(request):
+                if image.id in missing:
+                    names[image.id] = image.name
+                    _image_names.set(image.id, image.name)
+                    missing.discard(image.id)
+                    if not missing:
+                        break
+        except Exception as e:
+            LOG.warning("Unable to list images: %s" % e)
+            for image_id in missing:
+                names[image_id] = image_id
+            return names
+
+    for image_id in missing:
+        try:
+            names[image_id] = get_image_name(request, image_id)
+        except Exception:
+            LOG.warning("Unable to retrieve image %s" % image_id)
+            names[image_id] = image_id
+
+    return names
+
+
+IMAGES_LIST_LIMIT = getattr(settings, 'API_RESULT_LIMIT', 1000)
+
+
+def _iter_images(request, filters=None):
+    """Yields all the images visible to the tenant, page by page."""
+    marker = None
+    while True:
+        images, has_more = glance.image_list_detailed(request, marker=marker,
+                                                      filters=filters)
+        for image in images:
+            yield image
+        # unpaginated listings are silently cut at API_RESULT_LIMIT
+        if not images or not (has_more or len(images) >= IMAGES_LIST_LIMIT):
+            return
+        marker = images[-1].id
+
+
+# Glance filters selecting Hadoop images, e.g. {"property-hadoop": "true"};
+# when not configured, images are matched by name
+HADOOP_IMAGE_FILTERS = getattr(settings, 'SAVANNA_HADOOP_IMAGE_FILTERS', None)
+HADOOP_IMAGE_NAME_MARKS = ("image.final", "hadoop", "hdp")
+HADOOP_IMAGES_REFRESH_INTERVAL = getattr(
+    settings, 'SAVANNA_HADOOP_IMAGES_REFRESH_INTERVAL', 300)
+
+# (fetched_at, [(id, name), ...]) keyed by (tenant_id,); entries are
+# dropped only if they haven't been refreshed for a long time
+_hadoop_images = cache.TTLCache(256, HADOOP_IMAGES_REFRESH_INTERVAL * 12)
+_hadoop_images_refreshing = set()
+_hadoop_images_lock = threading.Lock()
+
+
+def list_hadoop_images(request):
+    """Returns (id, name) pairs of the images clusters can be built from.
+
+    The catalogue is cached per tenant. A stale catalogue is still
+    returned, while a fresh one is fetched in the background.
+    """
+    key = (request.user.tenant_id,)
+    entry = _hadoop_images.get(key)
+    if entry is None:
+        return _refresh_hadoop_images(request, key)
+
+    fetched_at, images = entry
+    if time.time() - fetched_at > HADOOP_IMAGES_REFRESH_INTERVAL:
+        with _hadoop_images_lock:
+            refresh = key not in _hadoop_images_refreshing
+            _hadoop_images_refreshing.add(key)
+        if refresh:
+            concurrency.spawn_detached(_refresh_hadoop_images, request,
+                                       key)
+    return images
+
+
+def _refresh_hadoop_images(request, key):
+    try:
+        if HADOOP_IMAGE_FILTERS is not None:
+            images = [(image.id, image.name) for image
+                      in _iter_images(request, HADOOP_IMAGE_FILTERS)]
+        else:
+            images = [(image.id, image.name) for image
+                      in _iter_images(request, {"status": "active"})
+                      if any(mark in image.name
+                             for mark in HADOOP_IMAGE_NAME_MARKS)]
+        _hadoop_images.set(key, (time.time(), images))
+        return images
+    except Exception:
+        # nobody reads the outcome of a background refresh
+        LOG.exception("Unable to refresh the Hadoop images of %s" % key)
+        raise
+    finally:
+        with _hadoop_images_lock:
+            _hadoop_images_refreshing.discard(key)
+
+
+IMAGE_NAMES_CACHE_TTL = getattr(settings, 'SAVANNA_IMAGE_NAMES_CACHE_TTL',
+                                300)
+
+# image names change rarely, and are shown on every cluster row refresh
+_image_names = cache.TTLCache(1024, IMAGE_NAMES_CACHE_TTL)
+
+
+def get_image_name(request, image_id):
+    name = _image_names.get(image_id)
+    if name is None:
+        name = _memoized(request, ("image_name", image_id),
+                         _get_image_name, request, image_id)
+        _image_names.set(image_id, name)
+    return name
+
+
+def _get_image_name(request, image_id):
+    return glance.image_get(request, image_id).name
+
+
+FLAVORS_CACHE_TTL = getattr(settings, 'SAVANNA_FLAVORS_CACHE_TTL', 300)
+
+FlavorInfo = collections.namedtuple("FlavorInfo",
+                                    ["id", "name", "vcpus", "ram", "disk"])
+
+# flavor indexes keyed by (region, tenant_id)
+_flavor_indexes = cache.TTLCache(256, FLAVORS_CACHE_TTL)
+
+
+class FlavorIndex(object):
+    """Flavors available to a tenant, looked up by either name or id."""
+
+    def __init__(self, flavors):
+        self.flavors = [FlavorInfo(f.id, f.name, f.vcpus, f.ram, f.disk)
+                        for f in flavors]
+        self._by_id = dict((f.id, f) for f in self.flavors)
+        self._by_name = dict((f.name, f) for f in self.flavors)
+
+    def get(self, name_or_id):
+        return self._by_id.get(name_or_id) or self._by_name.get(name_or_id)
+
+    def describe(self, name_or_id):
+        flavor = self.get(name_or_id)
+        if flavor is None:
+            return "Unknown flavor %s" % name_or_id
+        return "%s vcpu, %s Mb RAM, %s Gb disk" % (
+            flavor.vcpus, flavor.ram, flavor.disk)
+
+
+def get_flavor_index(request):
+    key = (getattr(request.user, "services_region", None),
+           request.user.tenant_id)
+    index = _flavor_indexes.get(key)
+    if index is None:
+        index = FlavorIndex(nova.flavor_list(request))
+        _flavor_indexes.set(key, index)
+    return index
 
 
 def _format_templates(tmpl_dict):
@@ -99,14 +827,37 @@ def _format_templates(tmpl_dict):
     return formatted
 
 
-def list_templates(request):
-    token = request.user.token.id
-    resp = requests.get(
-        get_savanna_address(request) + "/node-templates",
-        headers={"x-auth-token": token,
-                 "Content-Type": "application/json"})
+TEMPLATE_FILTERS = ("name", "node_type")
+
+
+def list_templates(request, marker=None, paginate=False, filters=None):
+    """Returns the node templates of the request's tenant.
+
+    Pagination and filters work the same way as for list_clusters.
+    """
+    limit = PAGE_SIZE if paginate else None
+    if filters:
+        templates, has_more = _filtered_listing(
+            request, "node_templates", _fetch_templates, ("node_type",),
+            filters, marker, limit)
+    else:
+        templates, has_more = _cached_listing(request, "node_templates",
+                                              _fetch_templates, marker, limit)
+    if paginate:
+        return templates, has_more
+    return templates
+
+
+def _fetch_templates(request, marker, limit, filters=None):
+    return _get_parsed(request,
+                       _page_path("/node-templates", marker, limit, filters),
+                       lambda resp: _parse_templates(resp, marker, limit))
+
+
+def _parse_templates(resp, marker, limit):
     if resp.status_code == 200:
-        templates_arr = resp.json()["node_templates"]
+        templates_arr, has_more = _page(resp.json()["node_templates"],
+                                        marker, limit)
         templates = []
         for template in templates_arr:
             id = template["id"]
@@ -115,23 +866,17 @@ def list_templates(request):
             node_type = template["node_type"]["name"]
             templ = NodeTemplate(id, name, node_type, flavor_id)
             templates.append(templ)
-        return templates
-    else:
-        return []
+        return templates, has_more
 
 
 def create_cluster(request, name, base_image_id, templates):
-    token = request.user.token.id
     post_data = {"cluster": {}}
     cluster_data = post_data["cluster"]
     cluster_data["base_image_id"] = base_image_id
     cluster_data["name"] = name
     cluster_data["node_templates"] = templates
-    resp = requests.post(
-        get_savanna_address(request) + "/clusters",
-        data=json.dumps(post_data),
-        headers={"x-auth-token": token,
-                 "Content-Type": "application/json"})
+    resp = client().post(request, "/clusters", post_data)
+    _invalidate_listing(request, "clusters")
 
     return resp.status_code == 202
 
@@ -139,7 +884,6 @@ def create_cluster(request, name, base_image_id, templates):
 def create_node_template(request, name, node_type, flavor_id,
                          job_tracker_opts, name_node_opts, task_tracker_opts,
                          data_node_opts):
-    token = request.user.token.id
     post_data = {"node_template": {}}
     template_data = post_data["node_template"]
     template_data["name"] = name
@@ -153,71 +897,267 @@ def create_node_template(request, name, node_type, flavor_id,
         template_data["task_tracker"] = task_tracker_opts
     if "dn" in str(node_type).lower():
         template_data["data_node"] = data_node_opts
-    resp = requests.post(get_savanna_address(request)
-                         + "/node-templates",
-        json.dumps(post_data),
-        headers={
-            "x-auth-token": token,
-            "Content-Type": "application/json"
-        })
+    resp = client().post(request, "/node-templates", post_data)
+    _invalidate_listing(request, "node_templates")
 
     return resp.status_code == 202
 
 
+# process option sets of a node template, by their node type abbreviation
+TEMPLATE_OPTIONS = (("jt", "job_tracker"), ("nn", "name_node"),
+                    ("tt", "task_tracker"), ("dn", "data_node"))
+
+
+def export_node_templates(request):
+    """Returns the node templates of the tenant as importable dicts.
+
+    Each dict has the name, node_type and flavor_id of a template, along
+    with the option sets of its processes.
+    """
+    resp = client().get(request, "/node-templates")
+    if resp.status_code != 200:
+        raise SavannaException(_("Unable to retrieve node templates."))
+    exported = []
+    for template in resp.json()["node_templates"]:
+        exported_template = {"name": template["name"],
+                             "node_type": template["node_type"]["name"],
+                             "flavor_id": template["flavor_id"]}
+        for _abbr, key in TEMPLATE_OPTIONS:
+            if key in template:
+                exported_template[key] = template[key]
+        exported.append(exported_template)
+    return exported
+
+
+def create_node_templates(request, templates):
+    """Creates node templates concurrently.
+
+    templates are dicts in the export_node_templates format. Returns a
+    dict telling for every template name whether it was created.
+    """
+    by_name = dict((template["name"], template) for template in templates)
+    return _bulk(_create_exported_template, request,
+                 [template["name"] for template in templates], by_name)
+
+
+def _create_exported_template(request, name, by_name):
+    template = by_name[name]
+    return create_node_template(
+        request, name, template["node_type"], template["flavor_id"],
+        *[template.get(key) for _abbr, key in TEMPLATE_OPTIONS])
+
+
 def terminate_cluster(request, cluster_id):
-    token = request.user.token.id
-    resp = requests.delete(
-        get_savanna_address(request) + "/clusters/" + cluster_id,
-        headers={"x-auth-token": token})
+    resp = client().delete(request, "/clusters/" + cluster_id)
+    _invalidate_listing(request, "clusters")
 
     return resp.status_code == 204
 
 
 def delete_template(request, template_id):
-    token = request.user.token.id
-    resp = requests.delete(
-        get_savanna_address(request) + "/node-templates/" + template_id,
-        headers={"x-auth-token": token})
+    resp = client().delete(request, "/node-templates/" + template_id)
+    _invalidate_listing(request, "node_templates")
 
     return resp.status_code == 204
 
 
+def create_clusters(request, names, base_image_id, templates):
+    """Creates identical clusters with the given names concurrently.
+
+    Returns a dict telling for every name whether its cluster was created.
+    """
+    return _bulk(create_cluster, request, names, base_image_id, templates)
+
+
+def terminate_clusters(request, cluster_ids):
+    """Terminates the clusters concurrently.
+
+    Returns a dict telling for every cluster id whether it was terminated.
+    """
+    return _bulk(terminate_cluster, request, cluster_ids)
+
+
+def delete_templates(request, template_ids):
+    """Deletes the node templates concurrently.
+
+    Returns a dict telling for every template id whether it was deleted.
+    """
+    return _bulk(delete_template, request, template_ids)
+
+
+# bulk calls made at a time on behalf of one dashboard request
+BULK_CONCURRENCY = getattr(settings, 'SAVANNA_BULK_CONCURRENCY', 5)
+
+
+def _bulk(func, request, ids, *args):
+    results = {}
+    for item_id, succeeded, error in concurrency.map_all(
+            lambda item_id: func(request, item_id, *args), ids,
+            limit=BULK_CONCURRENCY):
+        if error is not None:
+            LOG.warning("%s of %s failed: %s" % (func.__name__, item_id,
+                                                 error))
+        results[item_id] = error is None and bool(succeeded)
+    return results
+
+
 def get_cluster(request, cluster_id):
-    token = request.user.token.id
-    resp = requests.get(
-        get_savanna_address(request) + "/clusters/" + cluster_id,
-        headers={"x-auth-token": token})
-    cluster = resp.json()["cluster"]
+    cluster = _get_parsed(request, "/clusters/" + cluster_id,
+                          lambda resp: resp.json()["cluster"])
 
     return cluster
 
 
+def get_cluster_overview(request, cluster_id):
+    """Returns the details of a cluster, with its nodes only counted.
+
+    Only this small version of the details is kept for revalidation, and
+    rendering it doesn't depend on the number of nodes. If the full
+    details were already fetched for this request, they are summed up
+    instead of GETting the cluster again.
+    """
+    path = "/clusters/" + cluster_id
+    cluster = _request_memo(request).get(("parsed", path, None))
+    if cluster is not None:
+        overview = dict((key, value) for key, value in cluster.items()
+                        if key != "nodes")
+        overview["nodes_count"] = len(cluster["nodes"])
+        return overview
+    return _get_parsed(request, path, _parse_overview, variant="overview")
+
+
+def _parse_overview(resp):
+    if resp.status_code == 404:
+        # lets the clusters table drop the row of a terminated cluster
+        raise exceptions.NotFound(_("The cluster no longer exists."))
+    if resp.status_code != 200:
+        raise SavannaException(_("Unable to retrieve the cluster."))
+    cluster = resp.json()["cluster"]
+    cluster["nodes_count"] = len(cluster.pop("nodes"))
+    return cluster
+
+
+def get_cluster_brief(request, cluster_id):
+    """Returns the Cluster row of a single cluster.
+
+    This is what the clusters table polls while a cluster is changing its
+    state, so it costs one Savanna call.
+    """
+    cluster = get_cluster_overview(request, cluster_id)
+    return _make_cluster(cluster)
+
+
 def get_node_template(request, node_template_id):
-    token = request.user.token.id
-    resp = requests.get(
-        get_savanna_address(request) + "/node-templates/" + node_template_id,
-        headers={"x-auth-token": token})
-    node_template = resp.json()["node_template"]
+    node_template = _get_parsed(request,
+                                "/node-templates/" + node_template_id,
+                                lambda resp: resp.json()["node_template"])
 
     return node_template
 
 
-def get_cluster_nodes(request, cluster_id):
-    token = request.user.token.id
-    resp = requests.get(
-        get_savanna_address(request) + "/clusters/" + cluster_id,
-        headers={"x-auth-token": token})
-    nodes = resp.json()["cluster"]["nodes"]
+def get_cluster_nodes(request, cluster_id, marker=None, paginate=False):
+    """Returns the nodes of a cluster.
+
+    With paginate=True only the API_RESULT_PAGE_SIZE nodes following the
+    node whose VM id is marker are returned, as a (nodes, has_more)
+    tuple. Their VMs are then joined with the first page of the server
+    listing, and only those missing from it are fetched by id.
+    """
+    # the first page of servers doesn't depend on the cluster, both are
+    # fetched at once
+    cluster, servers = concurrency.gather(
+        (get_cluster, request, cluster_id),
+        (_list_servers, request))
+    if paginate:
+        nodes, has_more = _page(cluster["nodes"], marker, PAGE_SIZE,
+                                key="vm_id")
+        vm_ids = [node["vm_id"] for node in nodes]
+        vms = _join_servers(request, servers, vm_ids, max_pages=1)
+        vms.update(_get_servers(request,
+                                [vm_id for vm_id in vm_ids
+                                 if vm_id not in vms]))
+    else:
+        nodes = cluster["nodes"]
+        vms = _join_servers(request, servers,
+                            [node["vm_id"] for node in nodes])
     nodes_with_id = []
     for node in nodes:
-        vm = nova.server_get(request, node["vm_id"])
-        addresses = []
-        for network, address in vm.addresses.items():
-            addresses.extend(address)
-
-        nodes_with_id.append(ClusterNode(vm.id, "%s (%s)" % (vm.name, ", ".join(
-            [elem['addr'].__str__() for elem in addresses])),
+        nodes_with_id.append(ClusterNode(node["vm_id"],
+            vms,
             node["node_template"]["name"],
             node["node_template"]["id"]))
 
+    if paginate:
+        return nodes_with_id, has_more
     return nodes_with_id
+
+
+def get_cluster_node_groups(request, cluster_id):
+    """Returns the NodeGroups of a cluster.
+
+    They are counted from the cluster details alone, without calling
+    Nova, which makes them a cheap summary of very large clusters.
+    """
+    cluster = get_cluster(request, cluster_id)
+    counts = collections.OrderedDict()
+    names = {}
+    for node in cluster["nodes"]:
+        template = node["node_template"]
+        counts[template["id"]] = counts.get(template["id"], 0) + 1
+        names[template["id"]] = template["name"]
+    return [NodeGroup(template_id, names[template_id], count)
+            for template_id, count in counts.items()]
+
+
+def _get_servers(request, vm_ids):
+    servers = {}
+    for vm_id, server, error in concurrency.map_all(
+            lambda vm_id: nova.server_get(request, vm_id), vm_ids):
+        # a VM which can't be fetched is shown as not found
+        if error is None:
+            servers[vm_id] = server
+    return servers
+
+
+def _format_vm(vm_id, vm):
+    if vm is None:
+        return "%s (%s)" % (vm_id, "VM not found")
+    addresses = []
+    for network, address in vm.addresses.items():
+        addresses.extend(address)
+    return "%s (%s)" % (vm.name, ", ".join(
+        [elem['addr'].__str__() for elem in addresses]))
+
+
+# Nova cuts server listings at its osapi_max_limit, 1000 by default
+SERVERS_LIST_LIMIT = getattr(settings, 'SAVANNA_SERVERS_LIST_LIMIT', 1000)
+
+
+def _list_servers(request, marker=None):
+    """Returns the page of the tenant's servers following marker."""
+    search_opts = {"limit": SERVERS_LIST_LIMIT}
+    if marker is not None:
+        search_opts["marker"] = marker
+    return nova.server_list(request, search_opts=search_opts)
+
+
+def _join_servers(request, servers, vm_ids, max_pages=None):
+    """Returns a dict of the listed servers having the given ids.
+
+    servers is the first page of the tenant's servers, the next pages
+    are listed until all the ids are found, the listing ends or max_pages
+    pages were joined. Ids absent from those pages are not in the result.
+    """
+    missing = set(vm_ids)
+    found = {}
+    pages = 0
+    while True:
+        for server in servers:
+            if server.id in missing:
+                missing.discard(server.id)
+                found[server.id] = server
+        pages += 1
+        if not missing or len(servers) < SERVERS_LIST_LIMIT or \
+                pages == max_pages:
+            return found
+        servers = _list_servers(request, servers[-1].id)
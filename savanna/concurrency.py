@@ -0,0 +1,132 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 Mirantis Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import os
+import threading
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+
+
+POOL_SIZE = getattr(settings, 'SAVANNA_WORKER_THREADS', 10)
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ThreadPool(POOL_SIZE)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _call(func, args, kwargs):
+    _local.in_pool = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _local.in_pool = False
+
+
+class _InlineResult(object):
+    def __init__(self, func, args, kwargs):
+        self._error = None
+        self._value = None
+        try:
+            self._value = func(*args, **kwargs)
+        except Exception as e:
+            self._error = e
+
+    def get(self, timeout=None):
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def spawn(func, *args, **kwargs):
+    """Schedules func(*args, **kwargs) on the worker's shared thread pool.
+
+    Returns an object whose get(timeout=None) returns the call result,
+    re-raises its exception or raises TimeoutError. Calls spawned from a
+    pool thread are run inline, so nested fan-outs cannot starve the pool.
+    """
+    if getattr(_local, "in_pool", False):
+        return _InlineResult(func, args, kwargs)
+    return _get_pool().apply_async(_call, (func, args, kwargs))
+
+
+def spawn_detached(func, *args, **kwargs):
+    """Queues func(*args, **kwargs) on the shared pool, nobody waiting on it.
+
+    Unlike spawn, the call is queued even from a pool thread, which can
+    go on without waiting for it. Its result and errors are dropped.
+    """
+    _get_pool().apply_async(_call, (func, args, kwargs))
+
+
+def map_all(func, items, timeout=None, limit=None):
+    """Calls func(item) concurrently for every item.
+
+    Returns a list of (item, result, error) tuples in the order of items,
+    exactly one of result and error being meaningful for every item.
+    With limit, at most that many calls are in progress at a time.
+    """
+    pending = collections.deque()
+    outcomes = []
+    for item in items:
+        if limit and len(pending) >= limit:
+            outcomes.append(_outcome(pending.popleft(), timeout))
+        pending.append((item, spawn(func, item)))
+    while pending:
+        outcomes.append(_outcome(pending.popleft(), timeout))
+    return outcomes
+
+
+def _outcome(pending, timeout):
+    item, result = pending
+    try:
+        return item, result.get(timeout), None
+    except Exception as e:
+        return item, None, e
+
+
+def gather(*calls):
+    """Runs (func, arg, ...) calls concurrently, as one wave.
+
+    Returns their results in order. When any call fails, the first
+    failure is re-raised after all the calls have finished.
+    """
+    pending = [spawn(call[0], *call[1:]) for call in calls]
+    results = []
+    error = None
+    for result in pending:
+        try:
+            results.append(result.get())
+        except Exception as e:
+            results.append(None)
+            error = error or e
+    if error is not None:
+        raise error
+    return results
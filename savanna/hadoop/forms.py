@@ -15,9 +15,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import logging
 
+from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.utils import six
 from django.utils.translation import ugettext_lazy as _
 
 
@@ -25,9 +28,15 @@ from horizon import exceptions
 from horizon import forms
 from horizon import messages
 
+from savanna import concurrency
+from savanna.api.savanna import create_node_templates, get_flavor_index,\
+    list_templates, TEMPLATE_OPTIONS
+
 
 LOG = logging.getLogger(__name__)
 
+MAX_IMPORT_SIZE = getattr(settings, 'SAVANNA_MAX_IMPORT_SIZE', 1024 * 1024)
+
 
 class UpdateInstance(forms.SelfHandlingForm):
     def handle(self, request, data):
@@ -37,3 +46,87 @@ class UpdateInstance(forms.SelfHandlingForm):
 class UpdateTemplate(forms.SelfHandlingForm):
     def handle(self, request, data):
         pass
+
+
+class ImportNodeTemplates(forms.SelfHandlingForm):
+    templates_file = forms.FileField(
+        label=_("Node templates file"),
+        help_text=_("A JSON document exported from the node templates "
+                    "table."))
+
+    def clean_templates_file(self):
+        upload = self.cleaned_data["templates_file"]
+        if upload.size > MAX_IMPORT_SIZE:
+            raise forms.ValidationError(_("The file is too large."))
+        try:
+            templates = json.loads(upload.read())["node_templates"]
+            if not all(isinstance(t, dict) for t in templates):
+                raise ValueError()
+        except (ValueError, KeyError, TypeError):
+            raise forms.ValidationError(
+                _("The file is not a node templates export."))
+
+        # the whole file is checked against one flavor index and listing
+        try:
+            flavors, existing = concurrency.gather(
+                (get_flavor_index, self.request),
+                (list_templates, self.request))
+        except Exception:
+            LOG.exception("Unable to retrieve flavors and node templates")
+            raise forms.ValidationError(
+                _("Unable to check the node templates, please try again."))
+        names = set(template.name for template in existing)
+        errors = []
+        for template in templates:
+            name = template.get("name")
+            error = self._check_template(template, flavors, names)
+            if error is not None:
+                errors.append("%s: %s" % (name, error))
+            else:
+                names.add(name)
+        if errors:
+            raise forms.ValidationError(errors)
+        return templates
+
+    def _check_template(self, template, flavors, names):
+        name = template.get("name")
+        if not name or not isinstance(name, six.string_types):
+            return _("a name is required")
+        if name in names:
+            return _("the name is already used")
+        processes = str(template.get("node_type", "")).lower().split("+")
+        abbrs = [abbr for abbr, key in TEMPLATE_OPTIONS]
+        if not all(process in abbrs for process in processes):
+            return _("unknown node type")
+        for abbr, key in TEMPLATE_OPTIONS:
+            options = template.get(key)
+            if abbr in processes and not (isinstance(options, dict)
+                                          and "heap_size" in options):
+                return _("%s heap_size is required") % key
+        flavor_id = template.get("flavor_id")
+        flavor = None
+        if isinstance(flavor_id, six.string_types):
+            flavor = flavors.get(flavor_id)
+        if flavor is None:
+            return _("unknown flavor")
+        # flavors are referred to by name, as in the create workflow
+        template["flavor_id"] = flavor.name
+
+    def handle(self, request, data):
+        templates = data["templates_file"]
+        try:
+            results = create_node_templates(request, templates)
+        except:
+            exceptions.handle(request,
+                              _("Unable to import node templates."))
+            return False
+
+        created = [t["name"] for t in templates if results[t["name"]]]
+        failed = [t["name"] for t in templates if not results[t["name"]]]
+        if created:
+            messages.success(request, _("Imported node templates: %s")
+                             % ", ".join(created))
+        if failed:
+            messages.error(request, _("Unable to import node templates: %s")
+                           % ", ".join(failed))
+        return bool(created)
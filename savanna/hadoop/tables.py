@@ -18,19 +18,103 @@
 import logging
 
 from django import shortcuts
-from django import template
 from django.core import urlresolvers
 from django.template.defaultfilters import title
+from django.utils.html import conditional_escape
 from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
 from django.utils.translation import string_concat, ugettext_lazy as _
 
 from horizon import tables
-from savanna.api.savanna import delete_template, terminate_cluster
+from savanna.api.savanna import delete_templates, terminate_clusters,\
+    get_cluster_brief, get_flavor_index, get_image_names, SavannaException,\
+    CLUSTER_FILTERS, TEMPLATE_FILTERS
 
 
 LOG = logging.getLogger(__name__)
 
 
+class BulkBatchAction(tables.BatchAction):
+    """BatchAction carrying out the action on all the selected rows at once.
+
+    Subclasses implement bulk_action(request, obj_ids) returning a dict of
+    obj_id -> success; the per-row results are then reported through the
+    usual BatchAction messages.
+    """
+
+    def handle(self, table, request, obj_ids):
+        allowed_ids = [obj_id for obj_id in obj_ids
+                       if table._filter_action(self, request,
+                           table.get_object_by_id(obj_id))]
+        self.results = self.bulk_action(request, allowed_ids)
+        return super(BulkBatchAction, self).handle(table, request, obj_ids)
+
+    def action(self, request, obj_id):
+        if not self.results.get(obj_id):
+            raise SavannaException(_("Unable to %(action)s %(id)s") % {
+                "action": self._conjugate(), "id": obj_id})
+
+    def bulk_action(self, request, obj_ids):
+        raise NotImplementedError
+
+
+class ListingFilterAction(tables.FilterAction):
+    """FilterAction whose matching is done by the listing API call.
+
+    The view passes get_filters() to list_clusters/list_templates, which
+    return only the matching rows, so filter() has nothing left to do.
+    A query is made of "field:value" terms for the fields listed in
+    filter_fields, the remaining words are matched against names.
+    """
+    filter_fields = ()
+
+    def filter(self, table, data, filter_string):
+        return data
+
+    @classmethod
+    def _param_name(cls, table_name):
+        return "__".join([table_name, cls.name, "q"])
+
+    @classmethod
+    def get_query(cls, request, table_name):
+        # the filter form posts the query, the "More" link carries it
+        param_name = cls._param_name(table_name)
+        return request.POST.get(param_name) or \
+            request.GET.get(param_name, "")
+
+    @classmethod
+    def with_query(cls, table, pagination_string):
+        """Adds the table's filter query to its pagination string."""
+        query = cls.get_query(table.request, table._meta.name)
+        if not query:
+            return pagination_string
+        return "&".join([pagination_string, urlencode(
+            {cls._param_name(table._meta.name): query})])
+
+    @classmethod
+    def get_filters(cls, request, table_name):
+        query = cls.get_query(request, table_name)
+        filters = {}
+        words = []
+        for term in query.split():
+            field, sep, value = term.partition(":")
+            if sep and value and field in cls.filter_fields:
+                filters[field] = value
+            else:
+                words.append(term)
+        if words:
+            filters["name"] = " ".join(words)
+        return filters
+
+
+class ClusterFilterAction(ListingFilterAction):
+    filter_fields = CLUSTER_FILTERS
+
+
+class NodeTemplateFilterAction(ListingFilterAction):
+    filter_fields = TEMPLATE_FILTERS
+
+
 class CreateNodeTemplate(tables.LinkAction):
     name = "create_node_template"
     verbose_name = _("Create Node Template")
@@ -47,6 +131,20 @@ class CreateNodeTemplate(tables.LinkAction):
         return True
 
 
+class ImportTemplates(tables.LinkAction):
+    name = "import_templates"
+    verbose_name = _("Import Node Templates")
+    url = "horizon:savanna:hadoop:import_templates"
+    classes = ("btn-create",)
+
+
+class ExportTemplates(tables.LinkAction):
+    name = "export_templates"
+    verbose_name = _("Export Node Templates")
+    url = "horizon:savanna:hadoop:export_templates"
+    classes = ("btn-download",)
+
+
 class EditTemplate(tables.LinkAction):
     name = "edit"
     verbose_name = _("Edit Node Template")
@@ -57,7 +155,7 @@ class EditTemplate(tables.LinkAction):
         return True
 
 
-class DeleteTemplate(tables.BatchAction):
+class DeleteTemplate(BulkBatchAction):
     name = "delete_template"
     verbose_name = _("Delete Node Template")
     classes = ("btn-terminate", "btn-danger")
@@ -70,8 +168,8 @@ class DeleteTemplate(tables.BatchAction):
     def allowed(self, request, template):
         return True
 
-    def action(self, request, template_id):
-        delete_template(request, template_id)
+    def bulk_action(self, request, template_ids):
+        return delete_templates(request, template_ids)
 
 
 class CreateCluster(tables.LinkAction):
@@ -100,7 +198,7 @@ class EditCluster(tables.LinkAction):
         return True
 
 
-class TerminateCluster(tables.BatchAction):
+class TerminateCluster(BulkBatchAction):
     name = "terminate"
     verbose_name = _("Terminate Cluster")
 
@@ -114,14 +212,35 @@ class TerminateCluster(tables.BatchAction):
     def allowed(self, request, template):
         return True
 
-    def action(self, request, cluster_id):
-        terminate_cluster(request, cluster_id)
+    def bulk_action(self, request, cluster_ids):
+        return terminate_clusters(request, cluster_ids)
 
 
 def render_templates(instance):
-    template_name = 'savanna/hadoop/_nodes_list.html'
-    context = {"cluster": instance}
-    return template.loader.render_to_string(template_name, context)
+    # built directly rather than through a template, this is called for
+    # every row of the table
+    return mark_safe("<ul>%s</ul>" % "".join(
+        ["<li>%s</li>" % conditional_escape(template)
+         for template in instance.node_templates]))
+
+
+class ImageColumn(tables.Column):
+    def get_raw_data(self, cluster):
+        names = getattr(self, "_image_names", None)
+        if names is None or cluster.base_image_id not in names:
+            # the images of all the rows are resolved at once, with the
+            # request rendering the table; polled rows come on their own
+            image_ids = [row.base_image_id for row in self.table.data or ()]
+            names = self._image_names = get_image_names(
+                self.table.request, image_ids + [cluster.base_image_id])
+        return names[cluster.base_image_id]
+
+
+class UpdateClusterRow(tables.Row):
+    ajax = True
+
+    def get_data(self, request, cluster_id):
+        return get_cluster_brief(request, cluster_id)
 
 
 class ClustersTable(tables.DataTable):
@@ -138,7 +257,7 @@ class ClustersTable(tables.DataTable):
     node_template = tables.Column(render_templates,
         verbose_name=_("Node Templates"))
 
-    base_image = tables.Column("base_image",
+    base_image = ImageColumn("base_image_id",
         verbose_name=_("Base Image"))
 
     status = tables.Column("status",
@@ -152,20 +271,51 @@ class ClustersTable(tables.DataTable):
     class Meta:
         name = "clusters"
         verbose_name = _("Hadoop Clusters")
+        pagination_param = "clusters_marker"
         status_columns = ["status"]
-        table_actions = (CreateCluster, TerminateCluster)
+        row_class = UpdateClusterRow
+        table_actions = (ClusterFilterAction, CreateCluster,
+                         TerminateCluster)
         row_actions = EditCluster, TerminateCluster
 
+    def get_pagination_string(self):
+        return ClusterFilterAction.with_query(
+            self, super(ClustersTable, self).get_pagination_string())
+
+
+class FlavorColumn(tables.Column):
+    def get_raw_data(self, template):
+        if not hasattr(self, "_flavors"):
+            try:
+                self._flavors = get_flavor_index(self.table.request)
+            except Exception:
+                # the raw flavor references are shown while Nova is down,
+                # without asking it again for every row
+                LOG.warning("Unable to retrieve flavors", exc_info=True)
+                self._flavors = None
+        flavor = None
+        if self._flavors is not None:
+            flavor = self._flavors.get(template.flavor_name)
+        if flavor is None:
+            return template.flavor_name
+        return flavor.name
+
 
 class NodeTemplatesTable(tables.DataTable):
     name = tables.Column("name",
         verbose_name=_("Node template name"),
         link=("horizon:savanna:hadoop:node_template_details"))
     node_type = tables.Column("node_type", verbose_name=_("Node Type"))
-    flavor_name = tables.Column("flavor_name", verbose_name=_("Flavor name"))
+    flavor_name = FlavorColumn("flavor_name", verbose_name=_("Flavor name"))
 
     class Meta:
         name = "node_templates"
         verbose_name = _("Node Templates")
-        table_actions = (CreateNodeTemplate, DeleteTemplate)
+        pagination_param = "node_templates_marker"
+        table_actions = (NodeTemplateFilterAction, CreateNodeTemplate,
+                         ImportTemplates, ExportTemplates, DeleteTemplate)
         row_actions = (EditTemplate, DeleteTemplate)
+
+    def get_pagination_string(self):
+        return NodeTemplateFilterAction.with_query(
+            self, super(NodeTemplatesTable, self).get_pagination_string())
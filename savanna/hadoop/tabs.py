@@ -19,11 +19,12 @@ from django.utils.translation import ugettext_lazy as _
 
 from django.core.urlresolvers import reverse
 from django.utils import safestring
+from django.utils.http import urlencode
 from horizon import tabs, tables
 
-from openstack_dashboard.api import glance
-from savanna.api.savanna import get_cluster, get_cluster_nodes,\
-    get_node_template
+from savanna.api.savanna import get_cluster, get_cluster_overview,\
+    get_cluster_nodes, get_cluster_node_groups, get_node_template,\
+    get_image_name
 
 
 class DetailTab(tabs.Tab):
@@ -33,9 +34,15 @@ class DetailTab(tabs.Tab):
                      "_cluster_details_overview.html")
 
     def get_context_data(self, request):
-        cluster = get_cluster(request, self.tab_group.kwargs['cluster_id'])
-        base_image_name = glance.image_get(request,
-            cluster["base_image_id"]).name
+        cluster_id = self.tab_group.kwargs['cluster_id']
+        # tabs are loaded in order, the full details a nodes tab is about
+        # to fetch are fetched first so the overview is built from them
+        node_tabs = [self.tab_group.get_tab(slug)
+                       for slug in (NodeGroupsTab.slug, NodesTab.slug)]
+        if any(tab is not None and tab.load for tab in node_tabs):
+            get_cluster(request, cluster_id)
+        cluster = get_cluster_overview(request, cluster_id)
+        base_image_name = get_image_name(request, cluster["base_image_id"])
         return {"cluster": cluster, "base_image_name": base_image_name}
 
 
@@ -55,6 +62,14 @@ class ClusterNodesTable(tables.DataTable):
     class Meta:
         name = "cluster_nodes"
         verbose_name = _("Cluster Nodes")
+        pagination_param = "nodes_marker"
+
+    def get_pagination_string(self):
+        # the nodes tab isn't preloaded, the next page has to select it
+        return "&".join([
+            super(ClusterNodesTable, self).get_pagination_string(),
+            urlencode({ClusterDetailTabs.param_name: "%s__%s" % (
+                ClusterDetailTabs.slug, NodesTab.slug)})])
 
 
 class NodesTab(tabs.TableTab):
@@ -62,16 +77,56 @@ class NodesTab(tabs.TableTab):
     slug = "nodes_tab"
     table_classes = (ClusterNodesTable, )
     template_name = ("savanna/hadoop/_nodes_overview.html")
+    # loaded through ajax when opened, it calls Nova for every node shown
+    preload = False
+
+    def __init__(self, *args, **kwargs):
+        super(NodesTab, self).__init__(*args, **kwargs)
+        self._more = False
 
     def get_cluster_nodes_data(self):
-        nodes = get_cluster_nodes(self.request,
-            self.tab_group.kwargs['cluster_id'])
+        nodes, self._more = get_cluster_nodes(self.request,
+            self.tab_group.kwargs['cluster_id'],
+            marker=self.request.GET.get(
+                ClusterNodesTable._meta.pagination_param, None),
+            paginate=True)
         return nodes
 
+    def has_more_data(self, table):
+        return self._more
+
+
+class NodeGroupsTable(tables.DataTable):
+    template_name = TemplateColumn("template_name",
+        verbose_name=_("Node template name"),
+        link=("horizon:savanna:hadoop:node_template_details"))
+    count = tables.Column("count",
+        verbose_name=_("Nodes Count"))
+
+    def get_object_id(self, node_group):
+        return node_group.template_id
+
+    class Meta:
+        name = "node_groups"
+        verbose_name = _("Node Groups")
+
+
+class NodeGroupsTab(tabs.TableTab):
+    name = _("Summary")
+    slug = "node_groups_tab"
+    table_classes = (NodeGroupsTable, )
+    template_name = ("savanna/hadoop/_node_groups_overview.html")
+    # needs the whole node list of the cluster
+    preload = False
+
+    def get_node_groups_data(self):
+        return get_cluster_node_groups(self.request,
+            self.tab_group.kwargs['cluster_id'])
+
 
 class ClusterDetailTabs(tabs.TabGroup):
     slug = "cluster_details"
-    tabs = (DetailTab, NodesTab)
+    tabs = (DetailTab, NodeGroupsTab, NodesTab)
     sticky = True
 
 
@@ -19,7 +19,7 @@ from django.conf.urls.defaults import patterns, url
 
 from .views import IndexView, EditClusterView, ClusterDetailView,\
     EditTemplateView, CreateClusterView, CreateNodeTemplateView,\
-    NodeTemplateDetailView
+    NodeTemplateDetailView, ImportNodeTemplatesView, ExportNodeTemplatesView
 
 
 CLUSTERS = r'^(?P<instance_id>[^/]+)/%s$'
@@ -31,6 +31,10 @@ urlpatterns = patterns(VIEW_MOD,
     url(r'^create$', CreateClusterView.as_view(), name='create_cluster'),
     url(r'^create_template$', CreateNodeTemplateView.as_view(),
         name='create_template'),
+    url(r'^import_templates$', ImportNodeTemplatesView.as_view(),
+        name='import_templates'),
+    url(r'^export_templates$', ExportNodeTemplatesView.as_view(),
+        name='export_templates'),
     url(r'^clusters/(?P<cluster_id>[^/]+)/$', ClusterDetailView.as_view(),
         name='cluster_details'),
     url(r'^node_templates/(?P<node_template_id>[^/]+)/$',
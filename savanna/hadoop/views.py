@@ -15,37 +15,124 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import logging
 
 from django import http
 from django import shortcuts
+from django.conf import settings
 from django.core.urlresolvers import reverse, reverse_lazy
 from django.utils.datastructures import SortedDict
 from django.utils.translation import ugettext_lazy as _
+from django.views import generic
 
 from horizon import exceptions
 from horizon import forms
+from horizon import messages
 from horizon import tabs
 from horizon import tables
 from horizon import workflows
 
-from .forms import UpdateInstance, UpdateTemplate
-from savanna.api.savanna import list_templates, list_clusters
-from .tables import NodeTemplatesTable, ClustersTable
+from savanna import concurrency
+from savanna import instrumentation
+from .forms import UpdateInstance, UpdateTemplate, ImportNodeTemplates
+from savanna.api.savanna import list_templates, list_clusters,\
+    export_node_templates, listings_cache_stats
+from .tables import NodeTemplatesTable, ClustersTable,\
+    ClusterFilterAction, NodeTemplateFilterAction
 from .workflows import CreateCluster, CreateNodeTemplate
 from .tabs import ClusterDetailTabs, NodeTemplateDetailsTabs
 
 
 LOG = logging.getLogger(__name__)
 
+TABLE_DATA_TIMEOUT = getattr(settings, 'SAVANNA_TABLE_DATA_TIMEOUT', 60)
+DEBUG_FOOTER = getattr(settings, 'SAVANNA_DEBUG_FOOTER', False)
 
-class IndexView(tables.MultiTableView):
+# Django < 1.5 streams the iterators given to a plain HttpResponse
+StreamingHttpResponse = getattr(http, "StreamingHttpResponse",
+                                http.HttpResponse)
+
+
+class InstrumentedMixin(object):
+    """Logs the outbound calls made to serve each request of the view.
+
+    The hit/miss counters of the worker's listings cache are logged with
+    them. With SAVANNA_DEBUG_FOOTER on, both are also passed to the
+    template, as savanna_timings and savanna_listings_cache.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        self.timings = instrumentation.Summary(request)
+        response = super(InstrumentedMixin, self).dispatch(request, *args,
+                                                           **kwargs)
+        # tables and tabs fetch their data while the template renders
+        if hasattr(response, "add_post_render_callback"):
+            response.add_post_render_callback(self._log_timings)
+        else:
+            self._log_timings()
+        return response
+
+    def _log_timings(self, response=None):
+        LOG.info("%s %s: %s, listings cache: %s" % (
+            self.request.method, self.request.path, self.timings,
+            _format_cache_stats(listings_cache_stats())))
+
+    def get_context_data(self, **kwargs):
+        context = super(InstrumentedMixin, self).get_context_data(**kwargs)
+        if DEBUG_FOOTER:
+            context["savanna_timings"] = self.timings
+            # called by the template, after the tables fetched their data
+            context["savanna_listings_cache"] = listings_cache_stats
+        return context
+
+
+def _format_cache_stats(stats):
+    return "%(hits)d hits, %(misses)d misses, %(size)d entries" % stats
+
+
+class IndexView(InstrumentedMixin, tables.MultiTableView):
     table_classes = ClustersTable, NodeTemplatesTable
     template_name = 'savanna/hadoop/index.html'
 
+    def __init__(self, *args, **kwargs):
+        super(IndexView, self).__init__(*args, **kwargs)
+        self._more = {}
+
+    def _get_data_dict(self):
+        # every table's data is loaded in parallel, so the page waits for
+        # the slowest remote call instead of for all of them in a row
+        if not self._data:
+            pending = []
+            for table in self.table_classes:
+                name = table._meta.name
+                data_func = getattr(self, "get_%s_data" % name)
+                pending.append((table, concurrency.spawn(data_func)))
+            for table, result in pending:
+                try:
+                    data = result.get(TABLE_DATA_TIMEOUT)
+                except concurrency.TimeoutError:
+                    data = []
+                    messages.error(self.request,
+                        _('Timed out retrieving %s.')
+                        % table._meta.verbose_name)
+                self._data[table._meta.name] = data
+        return self._data
+
+    def has_more_data(self, table):
+        return self._more.get(table._meta.name, False)
+
+    def _get_marker(self, table):
+        return self.request.GET.get(table._meta.pagination_param, None)
+
     def get_node_templates_data(self):
         try:
-            node_templates = list_templates(self.request)
+            node_templates, self._more["node_templates"] = list_templates(
+                self.request,
+                marker=self._get_marker(NodeTemplatesTable),
+                paginate=True,
+                filters=NodeTemplateFilterAction.get_filters(
+                    self.request, NodeTemplatesTable._meta.name))
         except:
             node_templates = []
             exceptions.handle(self.request,
@@ -54,7 +141,12 @@ class IndexView(tables.MultiTableView):
 
     def get_clusters_data(self):
         try:
-            clusters = list_clusters(self.request)
+            clusters, self._more["clusters"] = list_clusters(
+                self.request,
+                marker=self._get_marker(ClustersTable),
+                paginate=True,
+                filters=ClusterFilterAction.get_filters(
+                    self.request, ClustersTable._meta.name))
         except:
             clusters = []
             exceptions.handle(self.request,
@@ -99,7 +191,7 @@ class EditTemplateView(forms.ModalFormView):
         pass
 
 
-class CreateClusterView(workflows.WorkflowView):
+class CreateClusterView(InstrumentedMixin, workflows.WorkflowView):
     workflow_class = CreateCluster
     template_name = "savanna/hadoop/create_cluster.html"
 
@@ -110,7 +202,8 @@ class CreateClusterView(workflows.WorkflowView):
         return initial
 
 
-class CreateNodeTemplateView(workflows.WorkflowView):
+class CreateNodeTemplateView(InstrumentedMixin,
+                             workflows.WorkflowView):
     workflow_class = CreateNodeTemplate
     template_name = "savanna/hadoop/create_node_template.html"
 
@@ -121,7 +214,7 @@ class CreateNodeTemplateView(workflows.WorkflowView):
         return initial
 
 
-class ClusterDetailView(tabs.TabView):
+class ClusterDetailView(InstrumentedMixin, tabs.TabView):
     tab_group_class = ClusterDetailTabs
     template_name = 'savanna/hadoop/cluster_detail.html'
 
@@ -133,7 +226,7 @@ class ClusterDetailView(tabs.TabView):
         pass
 
 
-class NodeTemplateDetailView(tabs.TabView):
+class NodeTemplateDetailView(InstrumentedMixin, tabs.TabView):
     tab_group_class = NodeTemplateDetailsTabs
     template_name = 'savanna/hadoop/node_template_details.html'
 
@@ -141,3 +234,32 @@ class NodeTemplateDetailView(tabs.TabView):
         context = super(NodeTemplateDetailView, self)\
         .get_context_data(**kwargs)
         return context
+
+
+class ImportNodeTemplatesView(InstrumentedMixin, forms.ModalFormView):
+    form_class = ImportNodeTemplates
+    template_name = 'savanna/hadoop/import_templates.html'
+    success_url = reverse_lazy("horizon:savanna:hadoop:index")
+
+
+class ExportNodeTemplatesView(generic.View):
+    def get(self, request, *args, **kwargs):
+        try:
+            templates = export_node_templates(request)
+        except:
+            exceptions.handle(request,
+                _('Unable to export node templates.'),
+                redirect=reverse("horizon:savanna:hadoop:index"))
+        response = StreamingHttpResponse(_export_document(templates),
+                                         content_type="application/json")
+        response["Content-Disposition"] = \
+            'attachment; filename="node_templates.json"'
+        return response
+
+
+def _export_document(templates):
+    # written template by template instead of as one big string
+    yield '{"node_templates": ['
+    for i, template in enumerate(templates):
+        yield (",\n" if i else "\n") + json.dumps(template, sort_keys=True)
+    yield "\n]}\n"
@@ -18,20 +18,25 @@
 import json
 import logging
 
+from django.conf import settings
 from django.utils.text import normalize_newlines
 from django.utils.translation import ugettext as _
 from django.utils.safestring import mark_safe
 
 from horizon import exceptions
 from horizon import forms
+from horizon import messages
 from horizon import workflows
 
-from openstack_dashboard.api import glance, nova
+from savanna import concurrency
 from savanna.api.savanna import list_templates, create_cluster,\
-    create_node_template
+    create_clusters, create_node_template, get_flavor_index,\
+    list_hadoop_images
 
 LOG = logging.getLogger(__name__)
 
+MAX_CLUSTERS_COUNT = getattr(settings, 'SAVANNA_MAX_CLUSTERS_COUNT', 50)
+
 
 class SelectProjectUserAction(workflows.Action):
     project_id = forms.ChoiceField(label=_("Project"))
@@ -58,9 +63,15 @@ class SelectProjectUser(workflows.Step):
 
 class GeneralConfigurationAction(workflows.Action):
     def __init__(self, request, context, *args, **kwargs):
+        # everything the form needs is fetched in one concurrent wave, the
+        # base image choices populated by the parent are then served from
+        # the image catalogue cache
+        templates, flavors, _images = concurrency.gather(
+            (list_templates, request),
+            (get_flavor_index, request),
+            (list_hadoop_images, request))
         super(GeneralConfigurationAction, self).__init__(request, context,
             *args, **kwargs)
-        templates = list_templates(request)
         jt_nn_templates = ((t.name, t.name) for t in templates
             if ("JT+NN" == t.node_type))
         jt_templates = ((t.name, t.name) for t in templates
@@ -77,18 +88,23 @@ class GeneralConfigurationAction(workflows.Action):
 
         self.templates = templates
         self.template_infos = {}
-        flavors = nova.flavor_list(request)
         for template in templates:
-            flavor_name = template.flavor_name
-            flavor = filter(lambda fl: fl.name == flavor_name, flavors)[0]
             self.template_infos[template.name] =\
-            "%s vcpu, %s Mb RAM, %s Gb disk" % (
-                flavor.vcpus, flavor.ram, flavor.disk)
+            flavors.describe(template.flavor_name)
 
     name = forms.CharField(
         label=_("Cluster name"),
         required=True)
 
+    count = forms.IntegerField(
+        label=_("Number of clusters"),
+        required=False,
+        initial=1,
+        min_value=1,
+        max_value=MAX_CLUSTERS_COUNT,
+        help_text=_("When more than one cluster is created, {n} in the "
+                    "cluster name is replaced with the cluster number."))
+
     base_image = forms.ChoiceField(
         label=_("Base image"),
         required=True)
@@ -145,11 +161,7 @@ class GeneralConfigurationAction(workflows.Action):
     )
 
     def populate_base_image_choices(self, request, context):
-        public_images, _more = glance.image_list_detailed(request)
-        return [(image.id, image.name) for image in public_images
-                if ("image.final" in image.name
-                    or "hadoop" in image.name
-                    or "hdp" in image.name)]
+        return list_hadoop_images(request)
 
     def get_help_text(self):
         extra = {}
@@ -163,10 +175,11 @@ class GeneralConfigurationAction(workflows.Action):
 
 class GeneralConfiguration(workflows.Step):
     action_class = GeneralConfigurationAction
-    contributes = ("name", "base_image", "templates")
+    contributes = ("name", "count", "base_image", "templates")
 
     def contribute(self, data, context):
         context["name"] = data.get('name')
+        context["count"] = data.get('count') or 1
         context["base_image"] = data.get('base_image')
         context["templates"] = json.loads(data.get('result_field'))
         return context
@@ -180,18 +193,47 @@ class CreateCluster(workflows.Workflow):
     default_steps = (GeneralConfiguration, )
 
     def handle(self, request, context):
+        names = cluster_names(context["name"], context.get("count") or 1)
         try:
-            return create_cluster(
-                request,
-                context["name"],
-                context["base_image"],
-                context["templates"],
-            )
-
+            if len(names) == 1:
+                return create_cluster(
+                    request,
+                    names[0],
+                    context["base_image"],
+                    context["templates"],
+                )
+            results = create_clusters(request, names,
+                                      context["base_image"],
+                                      context["templates"])
         except:
             exceptions.handle(request)
             return False
 
+        created = [name for name in names if results[name]]
+        failed = [name for name in names if not results[name]]
+        if created and failed:
+            messages.success(request, _("Created clusters: %s")
+                             % ", ".join(created))
+        if failed:
+            messages.error(request, _("Unable to create clusters: %s")
+                           % ", ".join(failed))
+        return not failed
+
+
+def cluster_names(pattern, count):
+    """Returns the names of count clusters created from one submission.
+
+    {n} in pattern is replaced with the cluster number, which is
+    appended to the name when there is no {n}.
+    """
+    if count == 1:
+        return [pattern.replace("{n}", "1")]
+    if "{n}" not in pattern:
+        pattern += "-{n}"
+    width = len(str(count))
+    return [pattern.replace("{n}", str(i).zfill(width))
+            for i in range(1, count + 1)]
+
 
 class SetNameFlavorTypeAction(workflows.Action):
     name = forms.CharField(
@@ -271,7 +313,7 @@ class SetNameFlavorTypeAction(workflows.Action):
         help_text_template = ("savanna/hadoop/_template_general_help.html")
 
     def populate_flavor_id_choices(self, request, context):
-        flavors = api.nova.flavor_list(request)
+        flavors = get_flavor_index(request).flavors
         flavor_list = [(flavor.name, flavor.name)
                        for flavor in flavors]
         return flavor_list
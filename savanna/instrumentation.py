@@ -0,0 +1,216 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 Mirantis Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import logging
+import re
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+
+LOG = logging.getLogger(__name__)
+
+STATSD_ADDRESS = getattr(settings, 'SAVANNA_STATSD_ADDRESS', None)
+STATSD_PREFIX = getattr(settings, 'SAVANNA_STATSD_PREFIX', 'savanna_dashboard')
+# keeps per-endpoint latency histograms of each worker, shown in the debug
+# footer
+LATENCY_HISTOGRAMS = getattr(settings, 'SAVANNA_LATENCY_HISTOGRAMS', False)
+
+_sinks = []
+
+
+def register_sink(sink):
+    """Adds a metrics sink.
+
+    A sink is any object with a timing(service, endpoint, seconds) method,
+    which is called after every outbound call.
+    """
+    _sinks.append(sink)
+
+
+def endpoint_name(method, path):
+    """Returns a low-cardinality name of a REST call, e.g. GET /clusters/*.
+    """
+    path = path.split("?")[0]
+    return "%s %s" % (method, re.sub(r"^(/[^/]+)/[^/]+", r"\1/*", path))
+
+
+class _Timer(object):
+    def __init__(self, request, service, endpoint):
+        self.request = request
+        self.service = service
+        self.endpoint = endpoint
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc_info):
+        seconds = time.time() - self.start
+        calls = getattr(self.request, "_savanna_calls", None)
+        if calls is None:
+            calls = self.request._savanna_calls = []
+        calls.append((self.service, self.endpoint, seconds))
+        for sink in _sinks:
+            try:
+                sink.timing(self.service, self.endpoint, seconds)
+            except Exception:
+                LOG.exception("Metrics sink %r failed" % sink)
+
+
+def timed(request, service, endpoint):
+    """Context manager timing one outbound call made for the request."""
+    return _Timer(request, service, endpoint)
+
+
+class InstrumentedModule(object):
+    """Wraps an API module whose functions take the request first.
+
+    Every function called through the wrapper is timed and counted as a
+    call to the given service.
+    """
+
+    def __init__(self, module, service):
+        self._module = module
+        self._service = service
+
+    def __getattr__(self, name):
+        func = getattr(self._module, name)
+
+        def call(request, *args, **kwargs):
+            with timed(request, self._service, name):
+                return func(request, *args, **kwargs)
+        return call
+
+
+class Summary(object):
+    """Outbound calls made so far for a request, grouped by service.
+
+    It is evaluated lazily, so that a template rendering it as a page
+    footer sees the calls made while rendering the rest of the page.
+    """
+
+    def __init__(self, request, started_at=None):
+        self.request = request
+        self.started_at = started_at or time.time()
+
+    @property
+    def calls(self):
+        return list(getattr(self.request, "_savanna_calls", []))
+
+    @property
+    def services(self):
+        """Returns (service, calls count, total ms) tuples."""
+        totals = collections.OrderedDict()
+        for service, endpoint, seconds in self.calls:
+            count, total = totals.get(service, (0, 0.0))
+            totals[service] = (count + 1, total + seconds * 1000)
+        return [(service, count, total)
+                for service, (count, total) in totals.items()]
+
+    @property
+    def histograms(self):
+        """Returns the latency histograms of this worker, if they are kept.
+        """
+        return latency_histograms()
+
+    @property
+    def elapsed(self):
+        return (time.time() - self.started_at) * 1000
+
+    def __str__(self):
+        return "%.0f ms, %s" % (self.elapsed, ", ".join(
+            ["%s: %d calls in %.0f ms" % service
+             for service in self.services]) or "no outbound calls")
+
+
+class StatsdSink(object):
+    """Sends call timings to a statsd server over UDP."""
+
+    def __init__(self, host, port, prefix=STATSD_PREFIX):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def timing(self, service, endpoint, seconds):
+        metric = "%s.%s.%s" % (self.prefix, service,
+                               re.sub(r"[^\w-]+", "_", endpoint).strip("_"))
+        try:
+            self._socket.sendto(
+                ("%s:%d|ms" % (metric, seconds * 1000)).encode("ascii"),
+                self.address)
+        except socket.error:
+            pass
+
+
+class HistogramSink(object):
+    """Keeps latency histograms per endpoint in the worker's memory."""
+
+    # upper bounds of the buckets, in milliseconds
+    BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def timing(self, service, endpoint, seconds):
+        ms = seconds * 1000
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                index = i
+                break
+        with self._lock:
+            histogram = self._histograms.setdefault(
+                (service, endpoint), [0] * (len(self.buckets) + 1))
+            histogram[index] += 1
+
+    def histograms(self):
+        """Returns {(service, endpoint): [count per bucket, overflow]}."""
+        with self._lock:
+            return dict((key, list(counts))
+                        for key, counts in self._histograms.items())
+
+    def labels(self):
+        """Returns the names of the buckets, overflow included."""
+        return (["<= %d ms" % bound for bound in self.buckets] +
+                ["> %d ms" % self.buckets[-1]])
+
+
+if STATSD_ADDRESS:
+    register_sink(StatsdSink(*STATSD_ADDRESS))
+
+_histogram_sink = None
+if LATENCY_HISTOGRAMS:
+    _histogram_sink = HistogramSink()
+    register_sink(_histogram_sink)
+
+
+def latency_histograms():
+    """Returns the latency histograms kept by this worker.
+
+    They are a (bucket labels, [(service, endpoint, counts)]) tuple, or
+    None without SAVANNA_LATENCY_HISTOGRAMS.
+    """
+    if _histogram_sink is None:
+        return None
+    histograms = _histogram_sink.histograms()
+    return (_histogram_sink.labels(),
+            [key + (histograms[key],) for key in sorted(histograms)])
@@ -21,7 +21,8 @@ setuptools.setup(
     name='savanna_horizon_plugin',
     version='0.1',
     url='https://github.com/Frostman/savanna-horizon',
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['benchmarks',
+                                                'benchmarks.*']),
     author='Mirantis Inc.',
     author_email='savanna-team@mirantis.com',
     license='Apache 2.0',